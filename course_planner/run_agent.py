@@ -12,10 +12,23 @@ import uuid
 import re
 import datetime
 import traceback
+import logging
+import inspect
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+try:
+    import orjson  # optional: faster JSON writes in save_json
+except ImportError:
+    orjson = None
+
 # PDF parsing
 import fitz  # PyMuPDF
+fitz.TOOLS.mupdf_display_errors(False)  # failures still raise; skip MuPDF's stderr chatter
+# plain-text extraction only: no ligature or image blocks
+PDF_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES & ~fitz.TEXT_PRESERVE_IMAGES
 
 # Composio SDK
 from composio import Composio
@@ -38,6 +51,7 @@ CALENDAR_ID = os.getenv("CALENDAR_ID", "primary")
 START_DATE = os.getenv("START_DATE")  # YYYY-MM-DD
 START_TIME = os.getenv("START_TIME", "09:00")
 TIMEZONE = os.getenv("TIMEZONE", "UTC")
+KEEP_DOWNLOAD = os.getenv("KEEP_DOWNLOAD") == "1"  # also persist in-memory downloads to DOWNLOAD_DIR
 
 # Tool slugs
 FIND_FILE_SLUG = "GOOGLEDRIVE_FIND_FILE"
@@ -46,40 +60,230 @@ NOTION_INSERT_ROW_SLUG = "NOTION_INSERT_ROW_DATABASE"
 CALENDAR_CREATE_EVENT_SLUG = "GOOGLECALENDAR_CREATE_EVENT"
 
 MAX_LESSONS = 12
-SLEEP_BETWEEN_CALLS = 0.35
+WEEK = datetime.timedelta(weeks=1)
+RETRY_BASE_DELAY = 0.35
+API_RATE_PER_SEC = 3.0  # Notion's documented average; shared default for the other services
+API_BURST = 5
+BATCH_MAX_WORKERS = 8
+BATCH_MAX_RETRIES = 3
+
+_WEEK_HDR = re.compile(r'^(Week\s*\d+)\s*[:\-]?\s*(.*)', re.I)
+_WORD_START = re.compile(r'(?<=\s)\S')
+# "week1".."week9", "week 0".."week 9": every week number starts with one of these digits
+_WEEK_PREFIXES = tuple(f"week{sep}{d}" for sep in ("", " ") for d in "0123456789")
 
 # ---------- Helpers ----------
-def info(msg): print("[INFO]", msg)
-def error(msg): print("[ERROR]", msg)
+# configure only our own logger: leave the root (and SDK/httpx loggers) alone
+log = logging.getLogger("planner")
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+log.addHandler(_handler)
+_level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+log.setLevel(_level if isinstance(_level, int) else logging.INFO)  # unknown names fall back to INFO
+log.propagate = False
+info = log.info
+error = log.error
 def save_json(path, obj):
-    with open(path, "w", encoding="utf-8") as fh:
-        json.dump(obj, fh, indent=2, default=str)
+    tmp = path + ".tmp"
+    if orjson is not None:
+        with open(tmp, "wb") as fh:
+            fh.write(orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(obj, fh, indent=2, default=str)
+    os.replace(tmp, path)  # atomic: never leave a half-written file behind
 def load_json(path):
     with open(path, "r", encoding="utf-8") as fh:
         return json.load(fh)
 
+RETRYABLE_STATUSES = (429, 503)
+# message fallback only trusts explicit wording, never a bare number (IDs and row counts contain digits)
+_STATUS_IN_MSG = re.compile(r'\b(?:HTTP|status(?:[ _]code)?)\s*[:=]?\s*(429|503)\b', re.I)
+_RATE_LIMIT_MSG = re.compile(r'rate[ -]?limit|too many requests', re.I)
+
+def error_status(err):
+    """
+    HTTP status behind a failed call: the exception's (or its response's) status attribute,
+    else an explicit "HTTP 429" / "status 503" / "rate limit" in the error message.
+    Never looks at tracebacks.
+    """
+    for obj in (err, getattr(err, "response", None)):
+        code = getattr(obj, "status_code", None) or getattr(obj, "status", None)
+        if isinstance(code, int):
+            return code
+    text = str(err or "")
+    m = _STATUS_IN_MSG.search(text)
+    if m:
+        return int(m.group(1))
+    return 429 if _RATE_LIMIT_MSG.search(text) else None
+
+def is_retryable(res) -> bool:
+    return res.get("status") in RETRYABLE_STATUSES
+
 def ensure_dir(path):
     if not os.path.exists(path):
         os.makedirs(path, exist_ok=True)
 
+def _cached_exists():
+    """
+    Return an os.path.exists that remembers its answers. Make a fresh one per download-path
+    resolution (candidate paths repeat across its steps) so results can't go stale.
+    """
+    cache = {}
+
+    def exists(p) -> bool:
+        r = cache.get(p)
+        if r is None:
+            r = cache[p] = os.path.exists(p)
+        return r
+    return exists
+
+def _find_pdf(root, exact):
+    """Walk root with os.scandir; return the file named exactly `exact`, else the first PDF seen."""
+    first_pdf = None
+    stack = [root]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    if entry.name == exact:
+                        return os.path.abspath(entry.path)
+                    if first_pdf is None and entry.name.lower().endswith(".pdf"):
+                        first_pdf = os.path.abspath(entry.path)
+    return first_pdf
+
+def _find_pdf_in_response(data, download_dir, exists=os.path.exists):
+    """Breadth-first scan of a (nested) tool response for an existing .pdf path."""
+    dq = deque([data])
+    candidates = []
+    seen = set()
+    while dq:
+        obj = dq.popleft()
+        if isinstance(obj, dict):
+            dq.extend(obj.values())
+        elif isinstance(obj, list):
+            dq.extend(obj)
+        elif isinstance(obj, str) and obj.lower().endswith(".pdf") and obj not in seen:
+            seen.add(obj)
+            candidates.append(obj)
+    for c in candidates:
+        candidate = c if os.path.isabs(c) else os.path.join(download_dir, c)
+        if exists(candidate):
+            return os.path.abspath(candidate)
+    return None
+
+# ---------- Rate limiting ----------
+class RateLimiter:
+    """
+    Thread-safe token bucket: up to `burst` calls go out immediately, then `rate` calls per second.
+    Callers only sleep once the burst budget is used up.
+    """
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.slow_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if self.rate < self.base_rate and now >= self.slow_until:
+            self.rate = self.base_rate
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+    def throttle(self, seconds: float = 10.0):
+        """Halve the rate for `seconds` after the API reports rate limiting."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = self.rate / 2
+            self.slow_until = now + seconds
+
 # ---------- Composio wrapper with robust execute ----------
 class ComposioWrapper:
-    def __init__(self, api_key: str, user_id: str = None, download_dir: str = None):
-        kwargs = {}
-        if api_key:
-            kwargs["api_key"] = api_key
-        if download_dir:
-            kwargs["file_download_dir"] = download_dir
-        self.client = Composio(**kwargs)
+    def __init__(self, api_key: str = None, user_id: str = None, download_dir: str = None, client: Composio = None):
+        if client is None:
+            kwargs = {}
+            if api_key:
+                kwargs["api_key"] = api_key
+            if download_dir:
+                kwargs["file_download_dir"] = download_dir
+            client = Composio(**kwargs)
+        self.client = client
         self.user_id = user_id
+        self._form_by_slug = {}  # tool slug -> index of the invocation form that worked last
+        self._call = self._resolve_call()
 
     def set_user(self, user_id: str):
         self.user_id = user_id
 
+    def _resolve_call(self):
+        """
+        Build a single keyword call from the signature of composio.tools.execute(...).
+        Returns None when the signature can't be introspected, so execute_tool falls back to probing.
+        """
+        try:
+            sig = inspect.signature(self.client.tools.execute)
+        except (TypeError, ValueError, AttributeError):
+            return None
+        # only names that can actually be passed as keywords (not *args / **kwargs)
+        keyword_kinds = (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)
+        params = {name for name, p in sig.parameters.items() if p.kind in keyword_kinds}
+        args_key = next((k for k in ("arguments", "args") if k in params), None)
+        if "slug" not in params or args_key is None:
+            return None
+        with_user = "user_id" in params
+
+        def call(tool_slug, arguments):
+            kwargs = {"slug": tool_slug, args_key: arguments}
+            if with_user:
+                kwargs["user_id"] = self.user_id
+            return self.client.tools.execute(**kwargs)
+        return call
+
+    @staticmethod
+    def _normalize(resp):
+        if isinstance(resp, dict):
+            ok = resp.get("successful", True)
+            data = resp.get("data", resp)
+            err = resp.get("error")
+        else:
+            ok = getattr(resp, "successful", True)
+            data = getattr(resp, "data", None) or resp
+            err = getattr(resp, "error", None)
+        status = None if ok else error_status(err)
+        return {"ok": ok, "data": data, "error": err, "status": status}
+
     def execute_tool(self, tool_slug: str, arguments: dict):
         """
-        Try several invocation signatures for composio.tools.execute(...) and normalize result.
+        Call composio.tools.execute(...) and normalize result.
+        Uses the call shape derived from the SDK signature; if that isn't available or is rejected
+        with a TypeError, tries several invocation signatures and remembers the one that worked for the slug.
         """
+        if self._call is not None:
+            try:
+                return self._normalize(self._call(tool_slug, arguments))
+            except TypeError:
+                pass  # derived call shape was wrong for this SDK: probe below
+            except Exception as e:
+                tb = traceback.format_exc()
+                return {"ok": False, "data": None, "error": f"{e}\n{tb}", "status": error_status(e)}
         attempts = []
         forms = [
             lambda: self.client.tools.execute(slug=tool_slug, user_id=self.user_id, arguments=arguments),
@@ -89,28 +293,58 @@ class ComposioWrapper:
             lambda: self.client.tools.execute(self.user_id, tool_slug, arguments),
             lambda: self.client.tools.execute(slug=tool_slug, args=arguments, user_id=self.user_id),
         ]
+        order = list(range(len(forms)))
+        cached = self._form_by_slug.get(tool_slug)
+        if cached is not None:
+            order.remove(cached)
+            order.insert(0, cached)
         last_exc = None
-        for f in forms:
+        for k in order:
             try:
-                resp = f()
-                if isinstance(resp, dict):
-                    ok = resp.get("successful", True)
-                    data = resp.get("data", resp)
-                    err = resp.get("error")
-                    return {"ok": ok, "data": data, "error": err}
-                else:
-                    ok = getattr(resp, "successful", True)
-                    data = getattr(resp, "data", None) or resp
-                    err = getattr(resp, "error", None)
-                    return {"ok": ok, "data": data, "error": err}
+                resp = forms[k]()
+                self._form_by_slug[tool_slug] = k
+                return self._normalize(resp)
             except TypeError as te:
                 last_exc = te
                 attempts.append(("TypeError", str(te)))
                 continue
             except Exception as e:
                 tb = traceback.format_exc()
-                return {"ok": False, "data": None, "error": f"{e}\n{tb}"}
-        return {"ok": False, "data": None, "error": f"All execute attempts failed. Last TypeError: {last_exc}; attempts: {attempts}"}
+                return {"ok": False, "data": None, "error": f"{e}\n{tb}", "status": error_status(e)}
+        return {"ok": False, "data": None, "error": f"All execute attempts failed. Last TypeError: {last_exc}; attempts: {attempts}", "status": None}
+
+    def batch_execute(self, tool_slug: str, arguments_list: list, max_workers: int = BATCH_MAX_WORKERS, limiter: RateLimiter = None):
+        """
+        Run the same tool for many argument dicts and return normalized results in input order.
+        Composio has no multipart batch endpoint, so calls are issued concurrently instead;
+        only rate-limited / unavailable (429/503) calls are retried, with exponential backoff.
+        If a limiter is given, every call acquires from it and it is throttled when calls get retried.
+        """
+        def run(k):
+            if limiter:
+                limiter.acquire()
+            return self.execute_tool(tool_slug, arguments_list[k])
+
+        results = [None] * len(arguments_list)
+        pending = list(range(len(arguments_list)))
+        delay = RETRY_BASE_DELAY
+        for attempt in range(BATCH_MAX_RETRIES + 1):
+            if not pending:
+                break
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as ex:
+                out = list(ex.map(run, pending))
+            retry = []
+            for k, res in zip(pending, out):
+                results[k] = res
+                if not res["ok"] and is_retryable(res):
+                    retry.append(k)
+            if retry and limiter:
+                limiter.throttle()
+            pending = retry
+        return results
 
 # ---------- Linking helpers ----------
 def link_tool_and_wait(composio_client: Composio, user_id: str, auth_config_id: str, friendly_name: str, timeout_seconds: int = 300):
@@ -138,61 +372,123 @@ def link_tool_and_wait(composio_client: Composio, user_id: str, auth_config_id:
         raise RuntimeError(f"Error waiting for connection for {friendly_name}: {e}\n{tb}")
 
 # ---------- PDF / parsing ----------
-def extract_text_from_pdf(path: str) -> str:
-    info(f"Extracting text from PDF: {path}")
-    doc = fitz.open(path)
-    texts = []
-    for p in doc:
-        texts.append(p.get_text())
-    return "\n".join(texts)
-
-def parse_lessons(text: str, max_lessons: int = MAX_LESSONS):
-    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+def _is_week(line: str) -> bool:
+    # cheap literal-prefix test; the regexes only run on lines that pass it
+    if not line or line[0] not in "Ww":
+        return False  # the common case: rejected before any slicing or lowercasing
+    head = line[:6].lower()
+    if head.startswith(_WEEK_PREFIXES):
+        return True
+    # rarer spellings: tabs/repeated spaces or non-ASCII digits after "Week"
+    return head[:4] == "week" and line[4:].lstrip()[:1].isdecimal()
+
+def _open_pdf(data):
+    if isinstance(data, (bytes, bytearray)):
+        return fitz.open(stream=data, filetype="pdf")
+    return fitz.open(data)
+
+def _page_text(page) -> str:
+    # build the TextPage once with minimal flags; unsorted plain text is all parse_lessons needs
+    return page.get_textpage(flags=PDF_TEXT_FLAGS).extractText()
+
+def _page_lines(text: str):
+    for ln in text.splitlines():
+        s = ln.strip()
+        if s:
+            yield s
+
+def iter_pdf_lines(data):
+    """Yield the non-empty, stripped text lines of a PDF (file path or raw bytes), page by page."""
+    if isinstance(data, (bytes, bytearray)):
+        info(f"Extracting text from in-memory PDF ({len(data)} bytes)")
+    else:
+        info(f"Extracting text from PDF: {data}")
+    # serial on purpose: MuPDF is not thread-safe, and worker processes cost more to start
+    # than plain-text extraction of a syllabus-sized PDF takes
+    doc = _open_pdf(data)
+    try:
+        for p in doc:
+            yield from _page_lines(_page_text(p))
+    finally:
+        doc.close()
+
+def parse_lessons(lines, max_lessons: int = MAX_LESSONS):
+    """
+    Group lines into (header, description) lessons, one per "Week N" header.
+    `lines` can be any iterable of text lines (e.g. iter_pdf_lines) or a single text blob.
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    kept = []
     lessons = []
-    i = 0
-    while i < len(lines):
-        m = re.match(r'^(Week\s*\d+)\s*[:\-]?\s*(.*)', lines[i], re.I)
+    header, desc_parts = None, []
+    for ln in lines:
+        s = ln.strip()
+        if not s:
+            continue
+        m = _WEEK_HDR.match(s) if _is_week(s) else None
         if m:
+            if header is not None:
+                lessons.append((header, " ".join(desc_parts).strip()))
+                if len(lessons) >= max_lessons:
+                    break  # nothing past this header is used; stop pulling lines
             header = m.group(1)
             rem = m.group(2).strip()
-            desc_parts = []
-            if rem:
-                desc_parts.append(rem)
-            j = i + 1
-            while j < len(lines) and not re.match(r'^(Week\s*\d+)', lines[j], re.I):
-                desc_parts.append(lines[j])
-                j += 1
+            desc_parts = [rem] if rem else []
+        elif header is not None:
+            desc_parts.append(s)
+        if header is None:
+            kept.append(s)  # only needed by the chunking fallback below
+    else:
+        if header is not None:
             lessons.append((header, " ".join(desc_parts).strip()))
-            i = j
-        else:
-            i += 1
     if not lessons:
-        words = text.split()
-        total = len(words)
-        if total == 0:
+        # no headers: cut the text into max_lessons chunks by character offset (no word list)
+        if not kept:
             return []
-        chunk = max(total // max_lessons, 1)
+        text = " ".join(kept)
+        parts = text.rsplit(None, max_lessons - 1)
+        if len(parts) < max_lessons:
+            # fewer words than lessons: one word each, the rest stay empty
+            return [(f"Week {k+1}", parts[k] if k < len(parts) else "") for k in range(max_lessons)]
+        # start offsets of the last max_lessons-1 words; cut k never passes tail[k],
+        # so a long token (e.g. a URL) can't leave later lessons empty
+        tail = []
+        pos = len(text)
+        for w in reversed(parts[1:]):
+            pos = text.rfind(w, 0, pos)
+            tail.append(pos)
+        tail.reverse()
+        total = len(text)
+        start = 0
         for k in range(max_lessons):
-            start = k * chunk
-            end = start + chunk if k < max_lessons - 1 else total
-            lessons.append((f"Week {k+1}", " ".join(words[start:end])))
+            end = total
+            if k < max_lessons - 1:
+                # size the cut from what is left and put it on a word start so no word is split
+                m = _WORD_START.search(text, start + max((total - start) // (max_lessons - k), 1))
+                end = min(m.start() if m else total, tail[k])
+            lessons.append((f"Week {k+1}", " ".join(text[start:end].split())))
+            start = end
     return lessons[:max_lessons]
 
 # ---------- Notion & Calendar helpers ----------
 # ---------- Notion helper ----------
-def create_notion_row(wrapper, database_id, title, content):
+def notion_row_args(database_id, title, content):
     props = [
         {"name": "Name", "type": "title", "value": title},
         {"name": "Description", "type": "rich_text", "value": content}  # match the Notion property
     ]
-    return wrapper.execute_tool("NOTION_INSERT_ROW_DATABASE", {
+    return {
         "database_id": database_id,
         "properties": props
-    })
+    }
+
+def create_notion_row(wrapper, database_id, title, content):
+    return wrapper.execute_tool(NOTION_INSERT_ROW_SLUG, notion_row_args(database_id, title, content))
 # ---------- Calendar helper ----------
 
-def create_calendar_event(wrapper: ComposioWrapper, calendar_id: str, start_iso: str, timezone: str, summary: str, description: str):
-    args = {
+def calendar_event_args(calendar_id: str, start_iso: str, timezone: str, summary: str, description: str):
+    return {
         "calendar_id": calendar_id,
         "start_datetime": start_iso,
         "timezone": timezone,
@@ -200,7 +496,9 @@ def create_calendar_event(wrapper: ComposioWrapper, calendar_id: str, start_iso:
         "description": description,
         "event_duration_hour": 1
     }
-    return wrapper.execute_tool(CALENDAR_CREATE_EVENT_SLUG, args)
+
+def create_calendar_event(wrapper: ComposioWrapper, calendar_id: str, start_iso: str, timezone: str, summary: str, description: str):
+    return wrapper.execute_tool(CALENDAR_CREATE_EVENT_SLUG, calendar_event_args(calendar_id, start_iso, timezone, summary, description))
 
 # ---------- Main ----------
 def main():
@@ -223,39 +521,46 @@ def main():
     user_id = connections.get("user_id") or COMPOSIO_USER_ID_ENV or str(uuid.uuid4())
     info(f"Using user_id: {user_id}")
 
-    composio_raw = Composio(api_key=COMPOSIO_API_KEY)
+    # one client for linking and tool calls, so they share its connection pool
+    composio_raw = Composio(api_key=COMPOSIO_API_KEY, file_download_dir=DOWNLOAD_DIR)
 
     # Link if needed
     connections.setdefault("connections", {})
+    dirty = connections.get("user_id") != user_id
     try:
         if "google_drive" not in connections["connections"] and GOOGLE_DRIVE_AUTH_CONFIG_ID:
             conn = link_tool_and_wait(composio_raw, user_id, GOOGLE_DRIVE_AUTH_CONFIG_ID, "Google Drive")
             connections["connections"]["google_drive"] = conn
-            save_json(CONNECTIONS_FILE, {"user_id": user_id, "connections": connections["connections"]})
+            dirty = True
         else:
             info("Google Drive connection exists or GOOGLE_DRIVE_AUTH_CONFIG_ID not provided.")
 
         if "notion" not in connections["connections"] and NOTION_AUTH_CONFIG_ID:
             conn = link_tool_and_wait(composio_raw, user_id, NOTION_AUTH_CONFIG_ID, "Notion")
             connections["connections"]["notion"] = conn
-            save_json(CONNECTIONS_FILE, {"user_id": user_id, "connections": connections["connections"]})
+            dirty = True
         else:
             info("Notion connection exists or NOTION_AUTH_CONFIG_ID not provided.")
 
         if "google_calendar" not in connections["connections"] and GOOGLE_CAL_AUTH_CONFIG_ID:
             conn = link_tool_and_wait(composio_raw, user_id, GOOGLE_CAL_AUTH_CONFIG_ID, "Google Calendar")
             connections["connections"]["google_calendar"] = conn
-            save_json(CONNECTIONS_FILE, {"user_id": user_id, "connections": connections["connections"]})
+            dirty = True
         else:
             info("Google Calendar connection exists or GOOGLE_CAL_AUTH_CONFIG_ID not provided.")
     except Exception as e:
         error(f"Auth/linking flow error: {e}")
         sys.exit(1)
+    finally:
+        # one write for everything linked above; also keeps earlier links if a later one fails
+        if dirty:
+            save_json(CONNECTIONS_FILE, {"user_id": user_id, "connections": connections["connections"]})
+            info(f"Connections saved to {CONNECTIONS_FILE}")
 
-    save_json(CONNECTIONS_FILE, {"user_id": user_id, "connections": connections["connections"]})
-    info(f"Connections saved to {CONNECTIONS_FILE}")
+    wrapper = ComposioWrapper(client=composio_raw, user_id=user_id)
 
-    wrapper = ComposioWrapper(api_key=COMPOSIO_API_KEY, user_id=user_id, download_dir=DOWNLOAD_DIR)
+    notion_rl = RateLimiter(API_RATE_PER_SEC, API_BURST)
+    cal_rl = RateLimiter(API_RATE_PER_SEC, API_BURST)
 
     # FIND file in Drive
     info(f"Searching Drive for file named exactly '{SYLLABUS_FILE_NAME}'...")
@@ -278,8 +583,6 @@ def main():
     file_id = file_meta.get("id") or file_meta.get("file_id") or file_meta.get("driveId")
     info(f"Found Drive file id: {file_id}")
 
-    time.sleep(SLEEP_BETWEEN_CALLS)
-
     # DOWNLOAD file
     info("Downloading file via Composio...")
     dl_resp = wrapper.execute_tool(DOWNLOAD_FILE_SLUG, {"file_id": file_id})
@@ -290,6 +593,7 @@ def main():
 
     # --------------- Robust local path resolution ---------------
     local_path = None
+    exists = _cached_exists()
 
     # 1) Common response keys
     for key in ("file_path", "path", "local_path", "download_path", "file", "name"):
@@ -297,96 +601,60 @@ def main():
         if val:
             # if it's just a name, build path
             candidate = val if os.path.isabs(val) else os.path.join(DOWNLOAD_DIR, val)
-            if os.path.exists(candidate):
+            if exists(candidate):
                 local_path = os.path.abspath(candidate)
                 break
             # also accept if val itself is a valid absolute path
-            if os.path.exists(val):
+            if exists(val):
                 local_path = os.path.abspath(val)
                 break
 
     # 2) If not found, check nested dicts (some SDKs return {'files':[{'file_path': ...}]})
     if not local_path:
-        def search_dict_for_path(obj):
-            if isinstance(obj, dict):
-                for k, v in obj.items():
-                    if isinstance(v, str) and v.lower().endswith(".pdf") and (os.path.exists(v) or os.path.exists(os.path.join(DOWNLOAD_DIR, v))):
-                        candidate = v if os.path.isabs(v) else os.path.join(DOWNLOAD_DIR, v)
-                        if os.path.exists(candidate):
-                            return os.path.abspath(candidate)
-                    elif isinstance(v, dict) or isinstance(v, list):
-                        found = search_dict_for_path(v)
-                        if found:
-                            return found
-            elif isinstance(obj, list):
-                for item in obj:
-                    found = search_dict_for_path(item)
-                    if found:
-                        return found
-            return None
-        local_path = search_dict_for_path(dl_data)
+        local_path = _find_pdf_in_response(dl_data, DOWNLOAD_DIR, exists)
 
     # 3) If still not found, recursively search DOWNLOAD_DIR for the exact filename
     if not local_path:
         info(f"Looking recursively under {DOWNLOAD_DIR} for '{SYLLABUS_FILE_NAME}' or any PDF...")
-        for root, dirs, files_in_dir in os.walk(DOWNLOAD_DIR):
-            for fname in files_in_dir:
-                if fname == SYLLABUS_FILE_NAME or fname.lower().endswith(".pdf"):
-                    candidate = os.path.join(root, fname)
-                    # prefer exact filename match, otherwise accept first pdf
-                    if fname == SYLLABUS_FILE_NAME:
-                        local_path = os.path.abspath(candidate)
-                        break
-                    if not local_path:
-                        local_path = os.path.abspath(candidate)
-            if local_path:
-                break
+        # prefer exact filename match, otherwise accept first pdf
+        local_path = _find_pdf(DOWNLOAD_DIR, SYLLABUS_FILE_NAME)
 
-    # 4) If dl_data contains a 'body' (bytes/text), write to file
+    # 4) If dl_data contains a 'body' (bytes/text), parse bytes in memory; write to file otherwise
+    pdf_bytes = None
     if not local_path and isinstance(dl_data, dict) and dl_data.get("body"):
         body = dl_data.get("body")
-        outp = os.path.join(DOWNLOAD_DIR, SYLLABUS_FILE_NAME)
-        mode = "wb" if isinstance(body, (bytes, bytearray)) else "w"
-        with open(outp, mode) as fh:
-            fh.write(body)
-        local_path = os.path.abspath(outp)
-
-    if not local_path or not os.path.exists(local_path):
+        if isinstance(body, (bytes, bytearray)):
+            pdf_bytes = body
+        if pdf_bytes is None or KEEP_DOWNLOAD:
+            outp = os.path.join(DOWNLOAD_DIR, SYLLABUS_FILE_NAME)
+            mode = "wb" if isinstance(body, (bytes, bytearray)) else "w"
+            with open(outp, mode) as fh:
+                fh.write(body)
+            local_path = os.path.abspath(outp)
+
+    if pdf_bytes is None and (not local_path or not os.path.exists(local_path)):
         error("Could not locate the downloaded PDF on disk. Here is the raw download response data for inspection:")
         print(json.dumps(dl_data, default=str, indent=2)[:4000])  # print truncated to avoid spamming
         sys.exit(1)
 
-    info(f"Syllabus downloaded to: {local_path}")
-    time.sleep(SLEEP_BETWEEN_CALLS)
+    if local_path:
+        info(f"Syllabus downloaded to: {local_path}")
+    else:
+        info("Syllabus downloaded into memory (set KEEP_DOWNLOAD=1 to also save it).")
 
-    # Extract text and parse lessons
+    # Extract text and parse lessons (lines are streamed from the PDF into the parser)
     try:
-        text = extract_text_from_pdf(local_path)
+        lessons = parse_lessons(iter_pdf_lines(pdf_bytes if pdf_bytes is not None else local_path), max_lessons=MAX_LESSONS)
     except Exception as e:
         error(f"Failed to parse PDF: {e}")
         sys.exit(1)
 
-    lessons = parse_lessons(text, max_lessons=MAX_LESSONS)
     if not lessons:
         error("No lessons parsed from PDF.")
         sys.exit(1)
     info(f"Parsed {len(lessons)} lessons.")
 
-    # Create Notion rows
-    if NOTION_DATABASE_ID:
-        info("Creating Notion rows...")
-        for (title, desc) in lessons:
-            info(f" -> Notion row: {title}")
-            nres = create_notion_row(wrapper, NOTION_DATABASE_ID, title, desc)
-            if not nres["ok"]:
-                error(f"Notion create failed: {nres['error']}")
-            else:
-                info("   Notion row created.")
-            time.sleep(SLEEP_BETWEEN_CALLS)
-    else:
-        info("NOTION_DATABASE_ID not set; skipping Notion creation.")
-
-    # Schedule Calendar events
+    # Build Calendar event arguments
     if START_DATE:
         try:
             dt0 = datetime.datetime.fromisoformat(START_DATE)
@@ -397,20 +665,38 @@ def main():
     hh, mm = [int(x) for x in START_TIME.split(":")]
     dt0 = dt0.replace(hour=hh, minute=mm, second=0, microsecond=0)
 
-    info("Creating calendar events...")
-    for i, (title, desc) in enumerate(lessons):
-        event_dt = dt0 + datetime.timedelta(weeks=i)
-        start_iso = event_dt.isoformat()
+    starts = [(dt0 + i * WEEK).isoformat() for i in range(len(lessons))]
+    cal_args = [calendar_event_args(CALENDAR_ID, start_iso, TIMEZONE, title, desc)
+                for start_iso, (title, desc) in zip(starts, lessons)]
+    for start_iso, (title, _) in zip(starts, lessons):
         info(f" -> Scheduling '{title}' at {start_iso} ({TIMEZONE})")
-        cresp = create_calendar_event(wrapper, CALENDAR_ID, start_iso, TIMEZONE, title, desc)
-        if not cresp["ok"]:
-            error(f"Calendar create failed: {cresp['error']}")
-        else:
-            info("   Event created.")
-        time.sleep(SLEEP_BETWEEN_CALLS)
+
+    # Notion and Calendar are independent services: push both at the same time
+    if NOTION_DATABASE_ID:
+        info("Creating Notion rows and calendar events...")
+    else:
+        info("NOTION_DATABASE_ID not set; skipping Notion creation.")
+        info("Creating calendar events...")
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        notion_future = None
+        if NOTION_DATABASE_ID:
+            notion_args = [notion_row_args(NOTION_DATABASE_ID, title, desc) for (title, desc) in lessons]
+            notion_future = ex.submit(wrapper.batch_execute, NOTION_INSERT_ROW_SLUG, notion_args, limiter=notion_rl)
+        cal_future = ex.submit(wrapper.batch_execute, CALENDAR_CREATE_EVENT_SLUG, cal_args, limiter=cal_rl)
+
+        if notion_future:
+            for (title, _), nres in zip(lessons, notion_future.result()):
+                if not nres["ok"]:
+                    error(f"Notion create failed for {title}: {nres['error']}")
+                else:
+                    info(f" -> Notion row created: {title}")
+        for (title, _), cresp in zip(lessons, cal_future.result()):
+            if not cresp["ok"]:
+                error(f"Calendar create failed for {title}: {cresp['error']}")
+            else:
+                info(f"   Event created: {title}")
 
     info("Done. Check Notion and Google Calendar for results.")
-    save_json(CONNECTIONS_FILE, {"user_id": user_id, "connections": connections["connections"]})
 
 if __name__ == "__main__":
     main()